@@ -5,7 +5,9 @@ Automates the complete daily sequence for Star Wars Galaxy of Heroes
 Screen: 3440x1440, Game Window: 1952x1096
 """
 
+import sys
 import time
+import asyncio
 import logging
 import pyautogui
 import cv2
@@ -17,6 +19,14 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 import io
+import json
+import zlib
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # Load environment variables
 load_dotenv()
@@ -28,67 +38,227 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Screen-change hashing kernels (JIT-compiled when numba is installed)
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def dhash_u64(gray):
+        """64-bit difference hash of a 8x9 uint8 grayscale image"""
+        h = np.uint64(0)
+        for r in range(8):
+            for c in range(8):
+                h = (h << np.uint64(1)) | np.uint64(gray[r, c + 1] > gray[r, c])
+        return h
+        
+    @njit(cache=True)
+    def hamming(a, b):
+        """Number of differing bits between two uint64 hashes"""
+        x = np.uint64(a) ^ np.uint64(b)
+        count = 0
+        while x:
+            x &= x - np.uint64(1)
+            count += 1
+        return count
+else:
+    def dhash_u64(gray):
+        """64-bit difference hash of a 8x9 uint8 grayscale image"""
+        bits = np.packbits(gray[:, 1:] > gray[:, :-1])
+        return int.from_bytes(bits.tobytes(), 'big')
+        
+    def hamming(a, b):
+        """Number of differing bits between two uint64 hashes"""
+        return bin(int(a) ^ int(b)).count('1')
+
+# Direct input via user32 on Windows; pyautogui elsewhere
+if sys.platform == 'win32':
+    import ctypes
+    _user32 = ctypes.windll.user32
+else:
+    _user32 = None
+    
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+KEYEVENTF_KEYUP = 0x0002
+VK_CODES = {
+    'esc': 0x1B, 'escape': 0x1B, 'enter': 0x0D, 'return': 0x0D,
+    'space': 0x20, 'tab': 0x09, 'backspace': 0x08,
+    'left': 0x25, 'up': 0x26, 'right': 0x27, 'down': 0x28,
+}
+
+def _virtual_key(key):
+    """Map a pyautogui key name to a Windows virtual-key code, or None"""
+    key = key.lower()
+    if key in VK_CODES:
+        return VK_CODES[key]
+    if len(key) == 1 and key.isalnum():
+        return ord(key.upper())
+    return None
+
+def _send_click(x, y):
+    """Left click at absolute screen pixel (x, y)"""
+    if _user32 is None:
+        pyautogui.click(x, y)
+        return
+    pyautogui.failSafeCheck()
+    _user32.SetCursorPos(int(x), int(y))
+    _user32.mouse_event(MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
+    _user32.mouse_event(MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
+
+def _send_key(key):
+    """Press and release a single key"""
+    vk = _virtual_key(key) if _user32 is not None else None
+    if vk is None:
+        pyautogui.press(key)
+        return
+    pyautogui.failSafeCheck()
+    _user32.keybd_event(vk, 0, 0, 0)
+    _user32.keybd_event(vk, 0, KEYEVENTF_KEYUP, 0)
+
 class SWGOHController:
     """Main controller for SWGOH automation"""
     
+    AI_IMAGE_SIZE = (768, 432)  # Max size of screenshots sent to Gemini
+    TEMPLATE_DIR = os.path.join('assets', 'ui_elements')
+    
+    # Fixed normalized click targets used by the scripted steps
+    STATIC_CLICK_POINTS = (
+        (0.82, 0.87),  # Multi Sim button
+        (0.5, 0.63),   # Sim confirm button
+        (0.25, 0.95),  # Free energy claim
+        (0.3, 0.75),   # Light Side play
+        (0.7, 0.75),   # Cantina play
+    )
+    
+    # Sent once with the model config instead of being repeated in every prompt
+    SYSTEM_INSTRUCTION = (
+        "You analyze screenshots of the Star Wars: Galaxy of Heroes game window. "
+        "Answer each question about the attached screenshot in exactly the format "
+        "requested, with no extra commentary."
+    )
+    
     def __init__(self, target_width=1952, target_height=1096):
         self.target_width = target_width
         self.target_height = target_height
         self.window = None
         self.window_rect = None
+        self._monitor = None
+        self._precomputed = {}  # (ai_x, ai_y) -> absolute pixel target
+        self._templates = {}  # name -> grayscale template (None if missing)
+        self._action_baseline = None  # dhash taken just before the last key/click
+        self._sct = mss.mss()  # Reused across captures instead of per-call setup
+        self._ai_cache = {}  # (frame_hash, prompt) -> (timestamp, response)
+        self.ai_cache_ttl = 2.0
+        self._loop = asyncio.new_event_loop()  # One loop so the async Gemini client stays bound to it
         pyautogui.FAILSAFE = True
-        pyautogui.PAUSE = 0.1
+        pyautogui.PAUSE = 0  # Callers already sleep between actions
         
         # Initialize AI
         api_key = os.getenv('GOOGLE_API_KEY')
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found")
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = genai.GenerativeModel('gemini-2.5-flash',
+                                           system_instruction=self.SYSTEM_INSTRUCTION)
         
     def find_window(self):
         """Find SWGOH window"""
+        # Re-validate the previously found window before enumerating again
+        if self.window is not None and self._revalidate_window():
+            return True
+            
         logger.info("Finding SWGOH window...")
         window_titles = ["Star Wars: Galaxy of Heroes", "Galaxy of Heroes", "SWGOH", "Star Wars"]
         
         for title in window_titles:
             try:
-                windows = gw.getWindowsWithTitle(title)
-                for window in windows:
-                    if (abs(window.width - self.target_width) < 100 and 
-                        abs(window.height - self.target_height) < 100):
-                        self.window = window
-                        self.window_rect = {
-                            'left': window.left,
-                            'top': window.top,
-                            'width': window.width,
-                            'height': window.height
-                        }
-                        logger.info(f"Found window: {window.title} at {self.window_rect}")
-                        return True
+                window = self._match_by_size(gw.getWindowsWithTitle(title))
+                if window is not None:
+                    self.set_window(window)
+                    logger.info(f"Found window: {window.title} at {self.window_rect}")
+                    return True
             except Exception as e:
                 continue
                 
         # Search by dimensions
         try:
-            all_windows = gw.getAllWindows()
-            for window in all_windows:
-                if (abs(window.width - self.target_width) < 100 and 
-                    abs(window.height - self.target_height) < 100):
-                    self.window = window
-                    self.window_rect = {
-                        'left': window.left,
-                        'top': window.top,
-                        'width': window.width,
-                        'height': window.height
-                    }
-                    logger.info(f"Found window by size: {window.title} at {self.window_rect}")
-                    return True
+            window = self._match_by_size(gw.getAllWindows())
+            if window is not None:
+                self.set_window(window)
+                logger.info(f"Found window by size: {window.title} at {self.window_rect}")
+                return True
         except Exception as e:
             logger.error(f"Error finding window: {e}")
             
         return False
         
+    def _match_by_size(self, windows, tolerance=100):
+        """Return the first window within tolerance of the target size, or None"""
+        if not windows:
+            return None
+        count = len(windows)
+        widths = np.fromiter((w.width for w in windows), dtype=np.int32, count=count)
+        heights = np.fromiter((w.height for w in windows), dtype=np.int32, count=count)
+        mask = ((np.abs(widths - self.target_width) < tolerance) &
+                (np.abs(heights - self.target_height) < tolerance))
+        if not mask.any():
+            return None
+        return windows[int(np.argmax(mask))]
+        
+    def _revalidate_window(self):
+        """Check the cached window is still usable; refresh its rect if it moved"""
+        try:
+            window = self.window
+            if not window.visible:
+                return False
+            rect = {
+                'left': window.left,
+                'top': window.top,
+                'width': window.width,
+                'height': window.height
+            }
+        except Exception:
+            return False
+            
+        if (abs(rect['width'] - self.target_width) >= 100 or
+            abs(rect['height'] - self.target_height) >= 100):
+            return False
+        if rect != self.window_rect:
+            self.set_window(window)
+        return True
+        
+    def set_window(self, window):
+        """Store the game window and cache its capture region"""
+        self.window = window
+        self.window_rect = {
+            'left': window.left,
+            'top': window.top,
+            'width': window.width,
+            'height': window.height
+        }
+        self._monitor = dict(self.window_rect)
+        self._precomputed = {
+            coords: self._to_pixels(*coords) for coords in self.STATIC_CLICK_POINTS
+        }
+        
+    def _to_pixels(self, ai_x, ai_y):
+        """Convert normalized (0.0-1.0) window coordinates to screen pixels"""
+        target_x = self.window_rect['left'] + (ai_x * self.window_rect['width'])
+        target_y = self.window_rect['top'] + (ai_y * self.window_rect['height'])
+        return (target_x, target_y)
+        
+    def close(self):
+        """Release the screen capture instance"""
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.close()
+            
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+        
     def focus_window(self):
         """Focus the game window"""
         if self.window:
@@ -100,52 +270,100 @@ class SWGOHController:
                 pass
         return False
         
-    def capture_window(self):
-        """Take screenshot of game window"""
+    def capture_raw(self):
+        """Grab the game window as a raw mss screenshot (BGRA buffer)"""
         if not self.window_rect:
             return None
         try:
-            with mss.mss() as sct:
-                monitor = {
-                    'left': self.window_rect['left'],
-                    'top': self.window_rect['top'],
-                    'width': self.window_rect['width'],
-                    'height': self.window_rect['height']
-                }
-                screenshot = sct.grab(monitor)
-                img = np.array(screenshot)
-                return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            return self._sct.grab(self._monitor)
         except Exception as e:
             logger.error(f"Screenshot failed: {e}")
             return None
             
-    def analyze_screen(self, prompt_text):
+    def frame_hash(self, screenshot):
+        """Cheap fingerprint of a raw screenshot for duplicate-frame detection"""
+        # 64x64 grayscale thumbnail: 4 KB to hash instead of the full frame
+        small = cv2.resize(np.asarray(screenshot), (64, 64), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY)
+        return zlib.crc32(gray.tobytes())
+        
+    def invalidate_ai_cache(self):
+        """Forget cached AI answers after the screen has been interacted with"""
+        self._ai_cache.clear()
+        
+    def _lookup_ai_cache(self, cache_key):
+        """Return a cached AI response if still fresh"""
+        cached = self._ai_cache.get(cache_key)
+        if cached and time.time() - cached[0] < self.ai_cache_ttl:
+            logger.debug("Using cached AI response")
+            return cached[1]
+        return None
+        
+    def _encode_screenshot(self, screenshot):
+        """Encode a raw screenshot as a Gemini image part"""
+        # Read the BGRA buffer straight into an RGB image in one pass
+        pil_image = Image.frombuffer('RGB', screenshot.size, screenshot.bgra, 'raw', 'BGRX', 0, 1)
+        # Gemini downsamples internally; coordinates stay normalized 0-1
+        pil_image.thumbnail(self.AI_IMAGE_SIZE, Image.BILINEAR)
+        
+        buf = io.BytesIO()
+        pil_image.save(buf, format='JPEG', quality=80, optimize=False)
+        return {'mime_type': 'image/jpeg', 'data': buf.getvalue()}
+        
+    def analyze_screen(self, prompt_text, generation_config=None):
         """Analyze current screen with AI"""
-        screenshot = self.capture_window()
+        screenshot = self.capture_raw()
         if screenshot is None:
             return None
             
-        rgb_image = cv2.cvtColor(screenshot, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
-        
-        img_byte_arr = io.BytesIO()
-        pil_image.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
+        # Same frame + same prompt within the TTL -> reuse the previous answer
+        cache_key = (self.frame_hash(screenshot), prompt_text)
+        cached = self._lookup_ai_cache(cache_key)
+        if cached is not None:
+            return cached
+            
         try:
-            image_data = {'mime_type': 'image/png', 'data': img_byte_arr.getvalue()}
-            response = self.model.generate_content([prompt_text, image_data])
+            image_data = self._encode_screenshot(screenshot)
+            response = self.model.generate_content([prompt_text, image_data],
+                                                   generation_config=generation_config)
+            self._ai_cache[cache_key] = (time.time(), response.text)
             return response.text
         except Exception as e:
             logger.error(f"AI analysis failed: {e}")
             return None
             
+    async def analyze_screen_async(self, prompt_text):
+        """Async analyze_screen; the frame is captured before the first await"""
+        screenshot = self.capture_raw()
+        if screenshot is None:
+            return None
+            
+        cache_key = (self.frame_hash(screenshot), prompt_text)
+        cached = self._lookup_ai_cache(cache_key)
+        if cached is not None:
+            return cached
+            
+        try:
+            image_data = self._encode_screenshot(screenshot)
+            response = await self.model.generate_content_async([prompt_text, image_data])
+            self._ai_cache[cache_key] = (time.time(), response.text)
+            return response.text
+        except Exception as e:
+            logger.error(f"AI analysis failed: {e}")
+            return None
+            
+    def run_async(self, coro):
+        """Run a coroutine on the controller's event loop"""
+        return self._loop.run_until_complete(coro)
+        
     def press_key(self, key, times=1, delay=0.3):
         """Press keyboard key"""
+        self.invalidate_ai_cache()
         self.focus_window()
         time.sleep(0.2)
+        self._action_baseline = self.screen_dhash()
         for _ in range(times):
-            pyautogui.press(key)
+            _send_key(key)
             time.sleep(delay)
         logger.info(f"Pressed key: {key} x{times}")
         
@@ -155,23 +373,109 @@ class SWGOHController:
             logger.error("Window rect not found")
             return
 
-        # Access window_rect using dictionary keys
-        win_x = self.window_rect['left']
-        win_y = self.window_rect['top']
-        win_w = self.window_rect['width']
-        win_h = self.window_rect['height']
-
-        # Calculate target pixels (Input is 0.0 to 1.0 float)
-        target_x = win_x + (ai_x * win_w)
-        target_y = win_y + (ai_y * win_h)
+        # Scripted coordinates are resolved when the window is found
+        target = self._precomputed.get((ai_x, ai_y))
+        if target is None:
+            target = self._to_pixels(ai_x, ai_y)
+        target_x, target_y = target
 
         # Perform the click
-        pyautogui.click(target_x, target_y)
+        self.invalidate_ai_cache()
+        self._action_baseline = self.screen_dhash()
+        _send_click(target_x, target_y)
         logger.info(f"Targeted Window Pixel {description}: ({target_x}, {target_y})")
         
-    def wait_for_screen_change(self, timeout=5):
-        """Wait for screen to change"""
-        time.sleep(timeout)
+    def _load_template(self, name):
+        """Load a grayscale UI template from TEMPLATE_DIR, or None if missing"""
+        if name not in self._templates:
+            path = os.path.join(self.TEMPLATE_DIR, f"{name}.png")
+            template = cv2.imread(path, cv2.IMREAD_GRAYSCALE) if os.path.exists(path) else None
+            if template is None:
+                # Logged once per name; callers fall back to their slower check
+                logger.info(f"No template image for '{name}' at {path}, using fallback")
+            self._templates[name] = template
+        return self._templates[name]
+        
+    def match_template(self, name, roi=(0.0, 0.0, 1.0, 1.0)):
+        """Best normalized match score for a template inside a normalized ROI.
+        
+        roi is (left, top, right, bottom) as fractions of the window.
+        Returns None when the template or screenshot is unavailable.
+        """
+        template = self._load_template(name)
+        if template is None:
+            return None
+        screenshot = self.capture_raw()
+        if screenshot is None:
+            return None
+            
+        img = np.asarray(screenshot)
+        h, w = img.shape[:2]
+        region = img[int(roi[1] * h):int(roi[3] * h), int(roi[0] * w):int(roi[2] * w)]
+        if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+            return None
+            
+        gray = cv2.cvtColor(region, cv2.COLOR_BGRA2GRAY)
+        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+        score = float(result.max())
+        logger.debug(f"Template '{name}' match score: {score:.2f}")
+        return score
+        
+    def screen_dhash(self):
+        """64-bit difference hash of the current window, or None"""
+        screenshot = self.capture_raw()
+        if screenshot is None:
+            return None
+        # Shrink first so the gray conversion only touches 72 pixels
+        small = cv2.resize(np.asarray(screenshot), (9, 8), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY)
+        return int(dhash_u64(gray))
+        
+    @staticmethod
+    def hash_distance(a, b):
+        """Hamming distance between two 64-bit hashes"""
+        return hamming(a, b)
+        
+    def wait_for_screen_change(self, timeout=5, poll_interval=0.05, threshold=3, baseline=None):
+        """Wait for screen to change, returning once the new screen has settled.
+        
+        Polls a dhash of the window; after the first change is seen, returns
+        as soon as two consecutive frames match. timeout is the upper bound,
+        and the whole of it is waited out if no change is seen, so this can
+        stand in for a fixed post-action sleep of that length.
+        
+        The change is measured against baseline, which defaults to the hash
+        press_key/click_at took just before acting, so a screen that changed
+        during the action's own delays still counts. Without either, the
+        current screen is the baseline.
+        """
+        deadline = time.time() + timeout
+        if baseline is None:
+            baseline, self._action_baseline = self._action_baseline, None
+        if baseline is None:
+            baseline = self.screen_dhash()
+        if baseline is None:
+            time.sleep(timeout)
+            return False
+            
+        previous = baseline
+        changed = False
+        stable_frames = 0
+        while time.time() < deadline:
+            time.sleep(poll_interval)
+            current = self.screen_dhash()
+            if current is None:
+                continue
+            if not changed:
+                changed = self.hash_distance(current, baseline) >= threshold
+            elif self.hash_distance(current, previous) < threshold:
+                stable_frames += 1
+                if stable_frames >= 2:
+                    return True
+            else:
+                stable_frames = 0
+            previous = current
+        return changed
         
     def is_popup_present(self):
         """Check if a popup/modal is present"""
@@ -187,6 +491,20 @@ class SWGOHController:
         """)
         return analysis and "YES" in analysis.upper()
         
+    # Structured reply for find_button_with_ai, so no free-text parsing is needed
+    BUTTON_RESPONSE_CONFIG = {
+        "response_mime_type": "application/json",
+        "response_schema": {
+            "type": "object",
+            "properties": {
+                "found": {"type": "boolean"},
+                "x_percent": {"type": "number"},
+                "y_percent": {"type": "number"},
+            },
+            "required": ["found"],
+        },
+    }
+    
     def find_button_with_ai(self, button_description, min_y=0.0, max_y=1.0):
         """Use AI to find button coordinates, filtering by vertical position"""
         analysis = self.analyze_screen(f"""
@@ -196,34 +514,33 @@ class SWGOHController:
         - x_percent: percentage from left (0-100)
         - y_percent: percentage from top (0-100)
         
-        Format: x_percent,y_percent
-        Example: 50,60
+        If the button is not found, set found to false.
+        """, generation_config=self.BUTTON_RESPONSE_CONFIG)
         
-        If button not found, return: NOT_FOUND
-        """)
-        
-        if not analysis or "NOT_FOUND" in analysis.upper():
+        if not analysis:
             logger.warning(f"AI could not find button: {button_description}")
             return None
             
         try:
-            import re
-            match = re.search(r'(\d{1,3})[,.]\s*(\d{1,3})', analysis)
-            if match:
-                x = int(match.group(1)) / 100.0
-                y = int(match.group(2)) / 100.0
-                
-                # NEW: Validate coordinates against constraints
-                if y < min_y or y > max_y:
-                    logger.warning(f"AI found object at {y*100}% height, but we expected between {min_y*100}%-{max_y*100}%. Ignoring.")
-                    return None
-                    
-                logger.info(f"AI found '{button_description}' at ({x*100:.0f}%, {y*100:.0f}%)")
-                return (x, y)
-        except Exception as e:
+            data = json.loads(analysis)
+        except ValueError as e:
             logger.error(f"Failed to parse coordinates: {e}")
+            return None
             
-        return None
+        if not data or not data.get("found") or "x_percent" not in data or "y_percent" not in data:
+            logger.warning(f"AI could not find button: {button_description}")
+            return None
+            
+        x = float(data["x_percent"]) / 100.0
+        y = float(data["y_percent"]) / 100.0
+        
+        # Validate coordinates against constraints
+        if y < min_y or y > max_y:
+            logger.warning(f"AI found object at {y*100}% height, but we expected between {min_y*100}%-{max_y*100}%. Ignoring.")
+            return None
+            
+        logger.info(f"AI found '{button_description}' at ({x*100:.0f}%, {y*100:.0f}%)")
+        return (x, y)
     
     # Update the definition line to include y_offset (default 0)
     def click_button_with_ai(self, button_description, fallback_x=0.8, fallback_y=0.9, y_offset=0):
@@ -241,16 +558,51 @@ class SWGOHController:
 class DailyRoutine:
     """Implements the 7-step daily routine"""
     
+    # Energy refill popup check shared by every battle step
+    ENERGY_POPUP_PROMPT = """
+    Is there a popup asking if you want to buy more energy or refill energy?
+    Look for text about "Buy Energy" or "Refill" or "Not enough energy".
+    
+    Answer: YES or NO
+    """
+    ENERGY_POPUP_ROI = (0.3, 0.3, 0.7, 0.7)
+    TEMPLATE_MATCH_THRESHOLD = 0.8
+    
     def __init__(self, controller):
         self.controller = controller
         
+    async def _exit_checking_energy_popup(self, exits, delay):
+        """Back out to home while the energy popup check is in flight.
+        
+        An open popup simply absorbs one escape, so the regular exits are sent
+        during the Gemini round-trip and one extra escape follows if needed.
+        """
+        # Local template match first; Gemini only when no template is available.
+        # popup_energy.png is not shipped, so this stays on Gemini until it is captured
+        score = self.controller.match_template('popup_energy', roi=self.ENERGY_POPUP_ROI)
+        if score is not None:
+            popup_present = score >= self.TEMPLATE_MATCH_THRESHOLD
+            await asyncio.to_thread(self.controller.press_key, 'esc', exits, delay)
+        else:
+            ai_task = asyncio.create_task(self.controller.analyze_screen_async(self.ENERGY_POPUP_PROMPT))
+            await asyncio.sleep(0)  # Let the task grab the frame before keys are sent
+            await asyncio.to_thread(self.controller.press_key, 'esc', exits, delay)
+            
+            analysis = await ai_task
+            popup_present = bool(analysis and "YES" in analysis.upper())
+            
+        if popup_present:
+            logger.info("Energy popup detected, closing...")
+            await asyncio.sleep(0.5)
+            await asyncio.to_thread(self.controller.press_key, 'esc')
+            
     def step1_claim_quests(self):
         """Step 1: Claim daily quest rewards"""
         logger.info("\n=== STEP 1: Claim Daily Quests ===")
         
         # Open quests menu
         self.controller.press_key('c')
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         analysis = self.controller.analyze_screen("""
         Look at the lower-left free energy area on this SWGOH quests screen.
@@ -277,13 +629,13 @@ class DailyRoutine:
         if should_click:
             logger.info("Energy claim available - clicking at (0.25, 0.95)...")
             self.controller.click_at(0.25, 0.95, "Claim Energy step 3")
-            time.sleep(1)
+            self.controller.wait_for_screen_change(timeout=1)
         else:
             logger.info("No claim button found (likely timer shown) - skipping energy claim click.")
             
         # Return to home screen
         self.controller.press_key('esc', times=1, delay=0.5)
-        time.sleep(1)
+        self.controller.wait_for_screen_change(timeout=1)
         
     def step2_energy_refill(self):
         """Step 2: Energy already purchased manually, skip to battles"""
@@ -297,7 +649,7 @@ class DailyRoutine:
         
         # 1. Open Mod Battles
         self.controller.press_key('e')
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # 2. CLICK MULTI SIM (Fixed Coordinate)
         # The button is always in the bottom right. 
@@ -305,29 +657,16 @@ class DailyRoutine:
         # that hits the button but avoids the bottom window border.
         logger.info("Clicking Multi Sim button (Static Config)...")
         self.controller.click_at(0.82, 0.87, "Multi Sim Button")
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # 3. CONFIRM POPUP (Keep AI here, as popups can vary)
         logger.info("Clicking Sim button (Static Config)...")
         self.controller.click_at(0.5, 0.63, "Sim Button")
-
-        time.sleep(3)
-        
-        # ... (rest of the energy check code remains the same) ...
-        analysis = self.controller.analyze_screen("""
-        Is there a popup asking if you want to buy more energy or refill energy?
-        Look for text about "Buy Energy" or "Refill" or "Not enough energy".
+        time.sleep(3)  # Fixed: the energy popup can arrive after the screen settles
         
-        Answer: YES or NO
-        """)
-        
-        if analysis and "YES" in analysis.upper():
-            logger.info("Energy popup detected, closing...")
-            self.controller.press_key('esc')
-            time.sleep(0.5)
-            
-        self.controller.press_key('esc', times=2, delay=0.5)
-        time.sleep(1)
+        # Check for energy popup while backing out
+        self.controller.run_async(self._exit_checking_energy_popup(exits=2, delay=0.5))
+        self.controller.wait_for_screen_change(timeout=1)
         
     def step4_fleet_battles(self):
         """Step 4: Fleet Battles Multi-Sim"""
@@ -335,35 +674,24 @@ class DailyRoutine:
         
         # Press U then S for Fleet Battles
         self.controller.press_key('u')
-        time.sleep(1)
+        self.controller.wait_for_screen_change(timeout=1)
         self.controller.press_key('s')
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # Use AI to find Multi Sim button
         # CONSTRAINT ADDED: min_y=0.80 (Must be in bottom 20% of screen)
         logger.info("Clicking Multi Sim button (Static Config)...")
         self.controller.click_at(0.82, 0.87, "Multi Sim Button")
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # 3. CONFIRM POPUP (Keep AI here, as popups can vary)
         logger.info("Clicking Sim button (Static Config)...")
         self.controller.click_at(0.5, 0.63, "Sim Button")
-        time.sleep(3)
+        time.sleep(3)  # Fixed: the energy popup can arrive after the screen settles
         
-        # Check for energy popup
-        analysis = self.controller.analyze_screen("""
-        Is there a popup asking if you want to buy more energy or refill energy?
-        Answer: YES or NO
-        """)
-        
-        if analysis and "YES" in analysis.upper():
-            logger.info("Energy popup detected, closing...")
-            self.controller.press_key('esc')
-            time.sleep(0.5)
-            
-        # Return to home screen
-        self.controller.press_key('esc', times=3, delay=1)
-        time.sleep(1)
+        # Check for energy popup while returning to home screen
+        self.controller.run_async(self._exit_checking_energy_popup(exits=3, delay=1))
+        self.controller.wait_for_screen_change(timeout=1)
         
     def step5_light_side_battles(self):
         """Step 5: Light Side Battles Multi-Sim"""
@@ -371,38 +699,27 @@ class DailyRoutine:
         
         # Press D for Campaigns
         self.controller.press_key('d')
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # Use AI to find Light Side Play button
         logger.info("Finding Light Side Play button with AI...")
         self.controller.click_at(0.3, 0.75, "Play")
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
 # Use AI to find Multi Sim button
         # CONSTRAINT ADDED: min_y=0.80 (Must be in bottom 20% of screen)
         logger.info("Clicking Multi Sim button (Static Config)...")
         self.controller.click_at(0.82, 0.87, "Multi Sim Button")
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # 3. CONFIRM POPUP (Keep AI here, as popups can vary)
         logger.info("Clicking Sim button (Static Config)...")
         self.controller.click_at(0.5, 0.63, "Sim Button")
-        time.sleep(3)
+        time.sleep(3)  # Fixed: the energy popup can arrive after the screen settles
         
-        # Check for energy popup
-        analysis = self.controller.analyze_screen("""
-        Is there a popup asking if you want to buy more energy?
-        Answer: YES or NO
-        """)
-        
-        if analysis and "YES" in analysis.upper():
-            logger.info("Energy popup detected, closing...")
-            self.controller.press_key('esc')
-            time.sleep(0.5)
-            
-        # Return to home screen
-        self.controller.press_key('esc', times=3, delay=1)
-        time.sleep(1)
+        # Check for energy popup while returning to home screen
+        self.controller.run_async(self._exit_checking_energy_popup(exits=3, delay=1))
+        self.controller.wait_for_screen_change(timeout=1)
         
     def step6_cantina_battles(self):
         """Step 6: Cantina Battles Multi-Sim"""
@@ -410,38 +727,27 @@ class DailyRoutine:
         
         # Press D for Campaigns
         self.controller.press_key('d')
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # Use AI to find Cantina Play button
         logger.info("Finding Cantina Play button with AI...")
         self.controller.click_at(0.7, 0.75, "Play")
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
 # Use AI to find Multi Sim button
         # CONSTRAINT ADDED: min_y=0.80 (Must be in bottom 20% of screen)
         logger.info("Clicking Multi Sim button (Static Config)...")
         self.controller.click_at(0.82, 0.87, "Multi Sim Button")
-        time.sleep(2)
+        self.controller.wait_for_screen_change(timeout=2)
         
         # 3. CONFIRM POPUP (Keep AI here, as popups can vary)
         logger.info("Clicking Sim button (Static Config)...")
         self.controller.click_at(0.5, 0.63, "Sim Button")
-        time.sleep(3)
+        time.sleep(3)  # Fixed: the energy popup can arrive after the screen settles
         
-        # Check for energy popup
-        analysis = self.controller.analyze_screen("""
-        Is there a popup asking if you want to buy more energy?
-        Answer: YES or NO
-        """)
-        
-        if analysis and "YES" in analysis.upper():
-            logger.info("Energy popup detected, closing...")
-            self.controller.press_key('esc')
-            time.sleep(0.5)
-            
-        # Return to home screen
-        self.controller.press_key('esc', times=3, delay=1)
-        time.sleep(1)
+        # Check for energy popup while returning to home screen
+        self.controller.run_async(self._exit_checking_energy_popup(exits=3, delay=1))
+        self.controller.wait_for_screen_change(timeout=1)
         
     def run_full_routine(self):
         """Execute all 7 steps in sequence"""
@@ -462,7 +768,7 @@ class DailyRoutine:
             try:
                 logger.info(f"\n--- Executing Step {i}/{len(steps)} ---")
                 step()
-                time.sleep(1)  # Brief pause between steps
+                self.controller.wait_for_screen_change(timeout=1)  # Brief pause between steps
             except Exception as e:
                 logger.error(f"Step {i} failed: {e}")
                 # Try to recover to home screen
@@ -528,7 +834,7 @@ def main():
                 logger.info(f"\n--- Executing Step {i}/{len(step_nums)} (Step {step_num}: {steps_map[step_num]}) ---")
                 try:
                     steps[step_num - 1]()
-                    time.sleep(1)
+                    controller.wait_for_screen_change(timeout=1)
                 except Exception as e:
                     logger.error(f"Step {step_num} failed: {e}")
                     # Try to recover to home screen
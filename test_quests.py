@@ -6,17 +6,29 @@ Setup: 3440x1440 screen, SWGOH windowed at 1952x1096
 """
 
 import time
+import asyncio
 import logging
 import pyautogui
 import cv2
 import numpy as np
-from PIL import Image
 import pygetwindow as gw
 import mss
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 import os
-import io
+import sys
+import random
+import zlib
+
+# DXcam (Desktop Duplication API) captures much faster than mss/GDI on Windows
+try:
+    import dxcam
+    DXCAM_AVAILABLE = sys.platform == 'win32'
+except ImportError:
+    DXCAM_AVAILABLE = False
+
+from utils.error_handler import CircuitBreaker
 
 # Load environment variables
 load_dotenv()
@@ -28,6 +40,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# zlib level for PNG encodes (Gemini uploads and debug saves): fastest, ~10% larger
+PNG_COMPRESS_LEVEL = 1
+JPEG_QUALITY = 85
+AI_MAX_SIDE = 1024  # Longest side of screenshots sent to Gemini; full-res copies stay on disk
+
+# Gemini errors worth retrying (rate limiting / temporary server trouble)
+GEMINI_TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+GEMINI_RETRY_ATTEMPTS = 3
+
 class SWGOHWindow:
     """Handles SWGOH window detection and interaction"""
     
@@ -36,11 +62,49 @@ class SWGOHWindow:
         self.target_height = target_height
         self.window = None
         self.window_rect = None
+        self._monitor = None
+        self._sct = None  # Created on first capture and reused afterwards
+        self._cam = None  # DXcam camera, created on first capture when available
+        self._use_dxcam = DXCAM_AVAILABLE
+        self._frame_buf = None  # Reused HxWx3 output of capture_window
+        
+    def set_window(self, window):
+        """Store the detected window and cache its capture region"""
+        self.window = window
+        self.window_rect = {
+            'left': window.left,
+            'top': window.top,
+            'width': window.width,
+            'height': window.height
+        }
+        self._monitor = dict(self.window_rect)
+        
+    def close(self):
+        """Release the screen capture instances"""
+        if self._cam is not None:
+            self._cam.release()
+            self._cam = None
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
         
     def find_swgo_window(self):
         """Find SWGOH window by size or title"""
+        # A window found earlier only needs a cheap re-check
+        if self.window is not None and self._revalidate_window():
+            return True
+            
         logger.info("Looking for SWGOH window...")
         
+        # Enumerate once and read each window's properties once;
+        # every property access is a separate Win32 call
+        try:
+            dims = [(w, w.width, w.height, w.title) for w in gw.getAllWindows()]
+        except Exception as e:
+            logger.error(f"Error listing windows: {e}")
+            logger.error("Could not find SWGOH window")
+            return False
+            
         # Try to find by window title
         window_titles = [
             "Star Wars: Galaxy of Heroes",
@@ -49,49 +113,61 @@ class SWGOHWindow:
             "Star Wars"
         ]
         
+        # Size tolerance test for every window in one vectorized pass
+        count = len(dims)
+        widths = np.fromiter((d[1] for d in dims), dtype=np.int32, count=count)
+        heights = np.fromiter((d[2] for d in dims), dtype=np.int32, count=count)
+        size_ok = ((np.abs(widths - self.target_width) < 50) &
+                   (np.abs(heights - self.target_height) < 50))
+        
         for title in window_titles:
-            try:
-                windows = gw.getWindowsWithTitle(title)
-                for window in windows:
-                    logger.info(f"Found window: {window.title} - Size: {window.width}x{window.height}")
-                    
-                    # Check if size matches expected SWGOH window
-                    if (abs(window.width - self.target_width) < 50 and 
-                        abs(window.height - self.target_height) < 50):
-                        self.window = window
-                        self.window_rect = {
-                            'left': window.left,
-                            'top': window.top,
-                            'width': window.width,
-                            'height': window.height
-                        }
-                        logger.info(f"SWGOH window found at: {self.window_rect}")
-                        return True
-            except Exception as e:
-                logger.debug(f"Error searching for title '{title}': {e}")
+            for i, (window, width, height, window_title) in enumerate(dims):
+                if title not in window_title:
+                    continue
+                logger.info(f"Found window: {window_title} - Size: {width}x{height}")
                 
+                # Check if size matches expected SWGOH window
+                if size_ok[i]:
+                    self.set_window(window)
+                    logger.info(f"SWGOH window found at: {self.window_rect}")
+                    return True
+                    
         # If not found by title, look for window with matching dimensions
-        try:
-            all_windows = gw.getAllWindows()
-            for window in all_windows:
-                if window.width > 0 and window.height > 0:  # Valid window
-                    if (abs(window.width - self.target_width) < 50 and 
-                        abs(window.height - self.target_height) < 50):
-                        self.window = window
-                        self.window_rect = {
-                            'left': window.left,
-                            'top': window.top,
-                            'width': window.width,
-                            'height': window.height
-                        }
-                        logger.info(f"Found window by dimensions: {window.title} at {self.window_rect}")
-                        return True
-        except Exception as e:
-            logger.error(f"Error listing windows: {e}")
+        hits = np.nonzero(size_ok & (widths > 0) & (heights > 0))[0]
+        if hits.size:
+            window, _, _, window_title = dims[hits[0]]
+            self.set_window(window)
+            logger.info(f"Found window by dimensions: {window_title} at {self.window_rect}")
+            return True
             
         logger.error("Could not find SWGOH window")
         return False
         
+    def _size_matches(self, width, height, tolerance=50):
+        """Check a window size against the expected SWGOH window size"""
+        return (abs(width - self.target_width) < tolerance and
+                abs(height - self.target_height) < tolerance)
+        
+    def _revalidate_window(self):
+        """Check the cached window still matches; refresh its rect if it moved"""
+        try:
+            window = self.window
+            rect = {
+                'left': window.left,
+                'top': window.top,
+                'width': window.width,
+                'height': window.height
+            }
+        except Exception as e:
+            logger.debug(f"Cached window no longer valid: {e}")
+            return False
+            
+        if not self._size_matches(rect['width'], rect['height']):
+            return False
+        if rect != self.window_rect:
+            self.set_window(window)
+        return True
+        
     def focus_window(self):
         """Bring window to foreground"""
         if self.window:
@@ -105,68 +181,98 @@ class SWGOHWindow:
         return False
         
     def capture_window(self):
-        """Capture screenshot of the SWGOH window"""
+        """Capture a BGR screenshot of the SWGOH window
+        
+        The returned array is a buffer reused by the next capture; copy it
+        if it has to outlive that.
+        """
         if not self.window_rect:
             logger.error("No window detected")
             return None
             
         try:
-            with mss.mss() as sct:
-                monitor = {
-                    'left': self.window_rect['left'],
-                    'top': self.window_rect['top'],
-                    'width': self.window_rect['width'],
-                    'height': self.window_rect['height']
-                }
-                
-                screenshot = sct.grab(monitor)
-                img = np.array(screenshot)
-                img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-                
-                logger.info(f"Screenshot captured: {img.shape}")
-                return img
+            frame = self._grab_dxcam() if self._use_dxcam else None
+            if frame is not None:
+                # Copy the DXcam frame into the reused output buffer
+                img = self._output_buffer(frame.shape[:2])
+                np.copyto(img, frame)
+            else:
+                if self._sct is None:
+                    self._sct = mss.mss()
+                screenshot = self._sct.grab(self._monitor)
+                raw = np.asarray(screenshot)
+                # Drop alpha straight into the reused buffer
+                img = self._output_buffer(raw.shape[:2])
+                cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR, dst=img)
+            
+            logger.info(f"Screenshot captured: {img.shape}")
+            return img
         except Exception as e:
             logger.error(f"Screenshot failed: {e}")
             return None
             
-    def press_key(self, key):
-        """Press a key while window is focused"""
-        if self.focus_window():
-            time.sleep(0.2)
+    def _output_buffer(self, shape):
+        """HxWx3 capture buffer, reallocated only when the window size changes"""
+        if self._frame_buf is None or self._frame_buf.shape[:2] != shape:
+            self._frame_buf = np.empty((*shape, 3), dtype=np.uint8)
+        return self._frame_buf
+        
+    def _grab_dxcam(self):
+        """One-shot BGR grab of the window from DXcam, or None to fall back to mss
+        
+        DXcam returns None when the desktop has not changed since its last
+        grab; mss covers that case instead of waiting for a new frame.
+        """
+        try:
+            if self._cam is None:
+                self._cam = dxcam.create(output_idx=0, output_color="BGR")
+            m = self._monitor
+            return self._cam.grab(region=(m['left'], m['top'],
+                                          m['left'] + m['width'], m['top'] + m['height']))
+        except Exception as e:
+            # e.g. the window is on another monitor or partly off-screen
+            logger.warning(f"DXcam capture failed, falling back to mss: {e}")
+            self._use_dxcam = False
+            return None
+            
+    def ensure_focused(self):
+        """Activate the window only if it is not already in the foreground"""
+        if not self.window:
+            return False
+        try:
+            if self.window.isActive:
+                return True
+        except Exception as e:
+            logger.error(f"Could not focus window: {e}")
+            return False
+        return self.focus_window()
+        
+    def press_key(self, key, settle=0.0):
+        """Press a key while window is focused
+        
+        settle is the wait for the UI to respond afterwards; callers sending
+        several keys can leave it at 0 and wait once at the end.
+        """
+        if self.ensure_focused():
             pyautogui.press(key)
             logger.info(f"Pressed key: {key}")
-            time.sleep(0.5)  # Wait for UI response
+            if settle:
+                time.sleep(settle)
             return True
         return False
 
 class GameStateAnalyzer:
     """Analyzes game state using AI"""
     
-    def __init__(self):
-        api_key = os.getenv('GOOGLE_API_KEY')
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-        logger.info("AI analyzer initialized")
-        
-    def analyze_quests_screen(self, screenshot):
-        """Analyze the quests menu screen"""
-        if screenshot is None:
-            return "No screenshot available"
-            
-        # Convert numpy array to PIL Image
-        rgb_image = cv2.cvtColor(screenshot, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
-        
-        # Convert to bytes for Gemini API
-        img_byte_arr = io.BytesIO()
-        pil_image.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        prompt = """
-        Analyze this Star Wars Galaxy of Heroes quests/daily activities screen.
+    # Shared context sent once as the model's system instruction
+    SYSTEM_INSTRUCTION = (
+        "You analyze screenshots of the Star Wars: Galaxy of Heroes game window. "
+        "Be specific about the UI elements you can see and format your answers "
+        "clearly with bullet points."
+    )
+    
+    QUESTS_PROMPT = """
+        Analyze this quests/daily activities screen.
         
         Provide a detailed breakdown of:
         1. What quest categories are visible (Daily, Weekly, Guild, etc.)
@@ -174,55 +280,139 @@ class GameStateAnalyzer:
         3. Any rewards ready to claim
         4. Current progress on active quests
         5. Time remaining for daily reset if visible
-        
-        Format your response clearly with bullet points.
         """
-        
-        try:
-            image_data = {'mime_type': 'image/png', 'data': img_byte_arr.getvalue()}
-            response = self.model.generate_content([prompt, image_data])
-            return response.text
-        except Exception as e:
-            logger.error(f"AI analysis failed: {e}")
-            return f"Analysis error: {e}"
-            
-    def analyze_general_state(self, screenshot):
-        """General game state analysis"""
-        if screenshot is None:
-            return "No screenshot available"
-            
-        rgb_image = cv2.cvtColor(screenshot, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
-        
-        # Convert to bytes for Gemini API
-        img_byte_arr = io.BytesIO()
-        pil_image.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        prompt = """
-        Analyze this Star Wars Galaxy of Heroes screen.
+    
+    STATE_PROMPT = """
+        Analyze this screen.
         
         Tell me:
         1. What screen/menu is currently open?
         2. What buttons or options are visible?
         3. Are there any notifications or alerts?
         4. What's the general state of the game interface?
+        """
+    
+    BATCH_PROMPT = """
+        The first image is the screen before pressing 'C'; the second is the
+        quests/daily activities screen that opened afterwards.
+        
+        For the first image, tell me:
+        1. What screen/menu is open
+        2. What buttons, notifications or alerts are visible
+        
+        For the second image, provide a breakdown of:
+        1. What quest categories are visible (Daily, Weekly, Guild, etc.)
+        2. Which quests are completed vs incomplete
+        3. Any rewards ready to claim
+        4. Current progress on active quests
+        5. Time remaining for daily reset if visible
         
-        Be specific about UI elements you can see.
+        Use an "Initial State" and a "Quests" heading.
         """
+    
+    def __init__(self):
+        api_key = os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel('gemini-2.5-flash',
+                                           system_instruction=self.SYSTEM_INSTRUCTION)
+        self.breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=60)
+        self._last_key = None  # (frame hash, prompt) of the last successful call
+        self._last_response = None
+        logger.info("AI analyzer initialized")
+        
+    async def _call_gemini(self, parts, attempts=GEMINI_RETRY_ATTEMPTS):
+        """Call Gemini, retrying transient errors with jittered exponential backoff"""
+        for attempt in range(attempts):
+            try:
+                return await self.breaker.call_async(self.model.generate_content_async, parts)
+            except GEMINI_TRANSIENT_ERRORS as e:
+                if attempt == attempts - 1:
+                    raise
+                delay = (2 ** attempt) + random.random()
+                logger.warning(f"Gemini call failed ({e}), retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
         
+    def encode_image(self, screenshot, use_png=False):
+        """Encode a BGR screenshot as a Gemini image part.
+        
+        JPEG by default; use_png=True keeps a lossless PNG for debugging.
+        """
+        # Gemini only needs UI-level detail; shrink before encoding and upload
+        h, w = screenshot.shape[:2]
+        scale = AI_MAX_SIDE / max(h, w)
+        if scale < 1:
+            screenshot = cv2.resize(screenshot, (int(w * scale), int(h * scale)),
+                                    interpolation=cv2.INTER_AREA)
+            
+        # OpenCV encodes the BGR array directly; no PIL image or BytesIO copy
+        if use_png:
+            ok, encoded = cv2.imencode('.png', screenshot,
+                                       [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
+            mime_type = 'image/png'
+        else:
+            ok, encoded = cv2.imencode('.jpg', screenshot,
+                                       [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            mime_type = 'image/jpeg'
+        if not ok:
+            raise ValueError("Could not encode screenshot")
+        return {'mime_type': mime_type, 'data': encoded.tobytes()}
+        
+    def frame_hash(self, screenshot):
+        """Cheap fingerprint of a frame (64x64 thumbnail) for duplicate detection"""
+        small = cv2.resize(screenshot, (64, 64), interpolation=cv2.INTER_AREA)
+        return zlib.crc32(small.tobytes())
+        
+    async def _analyze(self, screenshots, prompt, use_png=False):
+        """Send screenshots and a prompt to Gemini in one request, skipping repeats of the last frames"""
+        if not screenshots or any(s is None for s in screenshots):
+            return "No screenshot available"
+            
+        cache_key = (tuple(self.frame_hash(s) for s in screenshots), prompt)
+        if cache_key == self._last_key:
+            logger.info("Frame unchanged since last analysis, reusing response")
+            return self._last_response
+            
+        parts = [prompt] + [self.encode_image(s, use_png) for s in screenshots]
         try:
-            image_data = {'mime_type': 'image/png', 'data': img_byte_arr.getvalue()}
-            response = self.model.generate_content([prompt, image_data])
-            return response.text
+            response = await self._call_gemini(parts)
+            text = response.text
         except Exception as e:
             logger.error(f"AI analysis failed: {e}")
             return f"Analysis error: {e}"
+            
+        self._last_key = cache_key
+        self._last_response = text
+        return text
+        
+    async def analyze_quests_screen(self, screenshot, use_png=False):
+        """Analyze the quests menu screen (screenshot in BGR order)"""
+        return await self._analyze([screenshot], self.QUESTS_PROMPT, use_png)
+            
+    async def analyze_general_state(self, screenshot, use_png=False):
+        """General game state analysis (screenshot in BGR order)"""
+        return await self._analyze([screenshot], self.STATE_PROMPT, use_png)
+        
+    async def analyze_batch(self, screenshots, prompt=BATCH_PROMPT, use_png=False):
+        """Analyze several screenshots (BGR order) with a single multi-image request"""
+        return await self._analyze(list(screenshots), prompt, use_png)
+
+async def analyze_captures(analyzer, initial_screenshot, quests_screenshot):
+    """One batched request when both captures exist, else the single-screen analysis"""
+    if initial_screenshot is not None and quests_screenshot is not None:
+        return await analyzer.analyze_batch([initial_screenshot, quests_screenshot])
+    if quests_screenshot is not None:
+        return await analyzer.analyze_quests_screen(quests_screenshot)
+    if initial_screenshot is not None:
+        return await analyzer.analyze_general_state(initial_screenshot)
+    return "No screenshot available"
 
 def save_screenshot(screenshot, filename="test_screenshot.png"):
     """Save screenshot for debugging"""
     try:
-        cv2.imwrite(filename, screenshot)
+        cv2.imwrite(filename, screenshot, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
         logger.info(f"Screenshot saved: {filename}")
         return True
     except Exception as e:
@@ -244,55 +434,59 @@ def main():
         logger.error(f"Failed to initialize AI: {e}")
         return
     
-    # Step 1: Find SWGOH window
-    logger.info("\n[Step 1] Finding SWGOH window...")
-    if not window.find_swgo_window():
-        logger.error("Could not find SWGOH window. Make sure the game is open.")
-        return
-        
-    # Step 2: Capture initial state
-    logger.info("\n[Step 2] Capturing initial game state...")
-    initial_screenshot = window.capture_window()
-    if initial_screenshot is not None:
-        save_screenshot(initial_screenshot, "initial_state.png")
-        
-        logger.info("Analyzing initial state...")
-        initial_analysis = analyzer.analyze_general_state(initial_screenshot)
-        logger.info(f"\nInitial State Analysis:\n{initial_analysis}")
-    
-    # Step 3: Press 'C' to open quests
-    logger.info("\n[Step 3] Pressing 'C' to open quests menu...")
-    if not window.press_key('c'):
-        logger.error("Failed to press 'C' key")
-        return
+    try:
+        # Step 1: Find SWGOH window
+        logger.info("\n[Step 1] Finding SWGOH window...")
+        if not window.find_swgo_window():
+            logger.error("Could not find SWGOH window. Make sure the game is open.")
+            return
+            
+        # Step 2: Capture initial state
+        logger.info("\n[Step 2] Capturing initial game state...")
+        initial_screenshot = window.capture_window()
+        if initial_screenshot is not None:
+            initial_screenshot = initial_screenshot.copy()  # The next capture reuses the buffer
+            save_screenshot(initial_screenshot, "initial_state.png")
         
-    # Wait for menu to open
-    logger.info("Waiting for quests menu to open...")
-    time.sleep(2)
-    
-    # Step 4: Capture quests menu
-    logger.info("\n[Step 4] Capturing quests menu...")
-    quests_screenshot = window.capture_window()
-    if quests_screenshot is not None:
-        save_screenshot(quests_screenshot, "quests_menu.png")
+        # Step 3: Press 'C' to open quests
+        logger.info("\n[Step 3] Pressing 'C' to open quests menu...")
+        if not window.press_key('c'):
+            logger.error("Failed to press 'C' key")
+            return
+            
+        # Wait for menu to open
+        logger.info("Waiting for quests menu to open...")
+        time.sleep(2)
         
-        # Step 5: Analyze quests menu
-        logger.info("\n[Step 5] Analyzing quests menu with AI...")
-        quests_analysis = analyzer.analyze_quests_screen(quests_screenshot)
-        logger.info(f"\nQuests Analysis:\n{quests_analysis}")
+        # Step 4: Capture quests menu
+        logger.info("\n[Step 4] Capturing quests menu...")
+        quests_screenshot = window.capture_window()
+        if quests_screenshot is not None:
+            save_screenshot(quests_screenshot, "quests_menu.png")
+        else:
+            logger.error("Failed to capture quests menu screenshot")
+            
+        if initial_screenshot is None and quests_screenshot is None:
+            return
+            
+        # Step 5: Analyze the captured screens with AI (one request when both exist)
+        logger.info("\n[Step 5] Analyzing initial state and quests menu with AI...")
+        analysis = asyncio.run(analyze_captures(analyzer, initial_screenshot, quests_screenshot))
+        logger.info(f"\nAI Analysis:\n{analysis}")
         
         # Display results
         print("\n" + "="*50)
         print("TEST RESULTS")
         print("="*50)
         print(f"\nWindow found: {window.window_rect}")
-        print(f"Initial screenshot: initial_state.png")
-        print(f"Quests screenshot: quests_menu.png")
-        print(f"\nAI Analysis:\n{quests_analysis}")
+        if initial_screenshot is not None:
+            print(f"Initial screenshot: initial_state.png")
+        if quests_screenshot is not None:
+            print(f"Quests screenshot: quests_menu.png")
+        print(f"\nAI Analysis:\n{analysis}")
         print("\n" + "="*50)
-    else:
-        logger.error("Failed to capture quests menu screenshot")
-        
+    finally:
+        window.close()
     logger.info("\nTest completed!")
 
 if __name__ == "__main__":
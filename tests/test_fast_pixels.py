@@ -0,0 +1,47 @@
+"""
+Tests for the ROI scoring kernels in utils.fast_pixels
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils import fast_pixels
+
+
+def _planted_case():
+    """Random 40x30 ROI with a 6x5 template copied in at (x=11, y=17)"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(40, 30), dtype=np.uint8)
+    template = frame[17:23, 11:16].copy()
+    return frame, template
+
+
+def test_numpy_fallback_finds_planted_template():
+    frame, template = _planted_case()
+    scores = fast_pixels._roi_match_numpy(frame, template, 0.9)
+    assert scores.shape == (35, 26)
+    assert np.unravel_index(np.argmax(scores), scores.shape) == (17, 11)
+    assert scores[17, 11] == pytest.approx(1.0)
+
+
+def test_numpy_fallback_template_larger_than_roi():
+    frame, template = _planted_case()
+    assert fast_pixels._roi_match_numpy(template, frame, 0.9).shape == (0, 0)
+
+
+def test_numba_kernel_matches_numpy_fallback():
+    pytest.importorskip("numba")
+    frame, template = _planted_case()
+    for threshold in (0.0, 0.6, 0.9):
+        expected = fast_pixels._roi_match_numpy(frame, template, threshold)
+        actual = fast_pixels.roi_match(frame, template, threshold)
+        assert actual.shape == expected.shape
+        np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+
+def test_best_roi_match_reports_position():
+    frame, template = _planted_case()
+    score, (x, y) = fast_pixels.best_roi_match(frame, template)
+    assert (x, y) == (11, 17)
+    assert score == pytest.approx(1.0)
@@ -5,12 +5,15 @@ Provides comprehensive error detection, handling, and recovery mechanisms
 
 import time
 import logging
+import threading
 import traceback
+import bisect
 from typing import Dict, Any, Optional, Callable, List
 from dataclasses import dataclass
 from enum import Enum
 import functools
-from datetime import datetime, timedelta
+from collections import deque, Counter
+from datetime import datetime
 
 class ErrorSeverity(Enum):
     """Error severity levels"""
@@ -53,15 +56,27 @@ class RecoveryAction:
 class ErrorRecoveryManager:
     """Manages error detection and recovery"""
     
+    # Repeats of the same error signature within this window skip recovery
+    DUPLICATE_COOLDOWN = 5.0
+    
     def __init__(self, logger):
         self.logger = logger
-        self.error_history: List[ErrorInfo] = []
+        # Bounded history; per-category totals are kept incrementally
+        self.error_history: deque = deque(maxlen=1000)
+        self._category_counts: Counter = Counter()
+        # Monotonic seconds, parallel to error_history; a list so bisect indexing is O(1)
+        self._timestamps: List[float] = []
         self.recovery_actions = self.setup_recovery_actions()
         self.error_patterns = {}
+        self._cancel_recovery = threading.Event()
+        # (exception type, category, function) -> [last handled, last result, suppressed since]
+        self._recent_sigs: Dict[tuple, list] = {}
+        self._sig_lock = threading.Lock()
         self.recovery_stats = {
             'total_errors': 0,
             'resolved_errors': 0,
-            'failed_recoveries': 0
+            'failed_recoveries': 0,
+            'suppressed_errors': 0
         }
         
     def setup_recovery_actions(self) -> Dict[ErrorCategory, List[RecoveryAction]]:
@@ -139,7 +154,28 @@ class ErrorRecoveryManager:
     def handle_error(self, exception: Exception, category: ErrorCategory, 
                     severity: ErrorSeverity = ErrorSeverity.MEDIUM, 
                     context: Dict[str, Any] = None) -> bool:
-        """Handle and attempt to recover from error"""
+        """Handle and attempt to recover from error
+        
+        An error with the same signature as one handled less than
+        DUPLICATE_COOLDOWN seconds ago is counted but not recovered again;
+        the previous recovery result is returned instead.
+        """
+        sig = (type(exception).__name__, category, (context or {}).get('function'))
+        now = time.monotonic()
+        recent = self._recent_sigs.get(sig)
+        if recent is not None and now - recent[0] < self.DUPLICATE_COOLDOWN:
+            with self._sig_lock:
+                recent[2] += 1
+                first = recent[2] == 1
+            self.recovery_stats['suppressed_errors'] += 1
+            if first:
+                # Report the count once the cooldown ends, even if the error never recurs
+                timer = threading.Timer(recent[0] + self.DUPLICATE_COOLDOWN - now,
+                                        self._report_suppressed, (sig, recent))
+                timer.daemon = True
+                timer.start()
+            return recent[1]
+            
         error_info = ErrorInfo(
             exception=exception,
             severity=severity,
@@ -149,6 +185,10 @@ class ErrorRecoveryManager:
         )
         
         self.error_history.append(error_info)
+        self._timestamps.append(now)
+        if len(self._timestamps) > self.error_history.maxlen:
+            del self._timestamps[:-self.error_history.maxlen]
+        self._category_counts[category.value] += 1
         self.recovery_stats['total_errors'] += 1
         
         self.logger.error(f"Error detected: {category.value} - {str(exception)}", 
@@ -168,8 +208,17 @@ class ErrorRecoveryManager:
             self.recovery_stats['failed_recoveries'] += 1
             self.logger.error(f"Failed to recover from error: {category.value}")
             
+        self._recent_sigs[sig] = [time.monotonic(), recovered, 0]
         return recovered
         
+    def _report_suppressed(self, sig: tuple, recent: list):
+        """Log how many duplicates of sig were suppressed during its cooldown"""
+        with self._sig_lock:
+            count, recent[2] = recent[2], 0
+        if count:
+            self.logger.warning(f"Suppressed {count} duplicate {sig[0]} errors "
+                                f"({sig[1].value}) during cooldown")
+        
     def attempt_recovery(self, error_info: ErrorInfo) -> bool:
         """Attempt to recover from error using appropriate actions"""
         category = error_info.category
@@ -178,6 +227,9 @@ class ErrorRecoveryManager:
             self.logger.warning(f"No recovery actions for category: {category.value}")
             return False
             
+        self._cancel_recovery.clear()
+        last_attempt = error_info.timestamp
+        
         for recovery_action in self.recovery_actions[category]:
             if error_info.recovery_attempts >= recovery_action.max_attempts:
                 continue
@@ -185,9 +237,13 @@ class ErrorRecoveryManager:
             self.logger.info(f"Attempting recovery: {recovery_action.name}")
             
             try:
-                # Wait before attempting recovery
-                if recovery_action.delay_between_attempts > 0:
-                    time.sleep(recovery_action.delay_between_attempts)
+                # Wait before attempting recovery, minus time already spent since
+                # the error / previous attempt; cancel_recovery() interrupts the wait
+                elapsed = (datetime.now() - last_attempt).total_seconds()
+                needed = recovery_action.delay_between_attempts - elapsed
+                if needed > 0 and self._cancel_recovery.wait(needed):
+                    self.logger.info("Recovery cancelled")
+                    return False
                     
                 # Execute recovery action
                 success = recovery_action.action(error_info)
@@ -198,9 +254,15 @@ class ErrorRecoveryManager:
                     
             except Exception as e:
                 self.logger.error(f"Recovery action failed: {recovery_action.name}", exception=e)
+            finally:
+                last_attempt = datetime.now()
                 
         return False
         
+    def cancel_recovery(self):
+        """Abort an in-progress recovery without waiting out its delay"""
+        self._cancel_recovery.set()
+        
     # Recovery action implementations
     def wait_and_retry(self, error_info: ErrorInfo) -> bool:
         """Wait and retry the failed operation"""
@@ -268,40 +330,45 @@ class ErrorRecoveryManager:
         
     def get_error_summary(self) -> Dict[str, Any]:
         """Get summary of errors and recovery statistics"""
-        recent_errors = [e for e in self.error_history 
-                        if datetime.now() - e.timestamp < timedelta(hours=1)]
+        # Timestamps are appended in order, so the one-hour cutoff is a bisect
+        cutoff = time.monotonic() - 3600
+        recent_errors = len(self._timestamps) - bisect.bisect_left(self._timestamps, cutoff)
         
-        error_by_category = {}
-        for error in self.error_history:
-            category = error.category.value
-            if category not in error_by_category:
-                error_by_category[category] = 0
-            error_by_category[category] += 1
-            
         return {
             'total_errors': self.recovery_stats['total_errors'],
             'resolved_errors': self.recovery_stats['resolved_errors'],
             'failed_recoveries': self.recovery_stats['failed_recoveries'],
+            'suppressed_errors': self.recovery_stats['suppressed_errors'],
             'recovery_rate': (self.recovery_stats['resolved_errors'] / 
                             max(self.recovery_stats['total_errors'], 1)),
-            'recent_errors': len(recent_errors),
-            'errors_by_category': error_by_category
+            'recent_errors': recent_errors,
+            'errors_by_category': dict(self._category_counts)
         }
 
 def error_handler(category: ErrorCategory, severity: ErrorSeverity = ErrorSeverity.MEDIUM):
-    """Decorator for automatic error handling"""
+    """Decorator for automatic error handling
+    
+    The recovery manager is taken from the first argument exposing
+    `error_recovery` (normally `self`, i.e. arg 0); its position is cached
+    per decorated function after the first lookup.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
             except Exception as e:
-                # Get error recovery manager from args or create new one
+                # Get error recovery manager from args, reusing the cached position
                 recovery_manager = None
-                for arg in args:
-                    if hasattr(arg, 'error_recovery'):
-                        recovery_manager = arg.error_recovery
-                        break
+                index = wrapper._recovery_arg_index
+                if index is not None and index < len(args) and hasattr(args[index], 'error_recovery'):
+                    recovery_manager = args[index].error_recovery
+                else:
+                    for i, arg in enumerate(args):
+                        if hasattr(arg, 'error_recovery'):
+                            recovery_manager = arg.error_recovery
+                            wrapper._recovery_arg_index = i
+                            break
                         
                 if recovery_manager:
                     context = {
@@ -319,6 +386,7 @@ def error_handler(category: ErrorCategory, severity: ErrorSeverity = ErrorSeveri
                     raise
                     
                 return None
+        wrapper._recovery_arg_index = None
         return wrapper
     return decorator
 
@@ -344,23 +412,42 @@ class CircuitBreaker:
         
     def call(self, func: Callable, *args, **kwargs):
         """Execute function with circuit breaker protection"""
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record_failure()
+            raise e
+        self._record_success()
+        return result
+        
+    async def call_async(self, func: Callable, *args, **kwargs):
+        """Await a coroutine function with circuit breaker protection"""
+        self._before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            self._record_failure()
+            raise e
+        self._record_success()
+        return result
+        
+    def _before_call(self):
+        """Reject the call while OPEN, or move to HALF_OPEN after the timeout"""
         if self.state == "OPEN":
             if (datetime.now() - self.last_failure_time).seconds > self.recovery_timeout:
                 self.state = "HALF_OPEN"
             else:
                 raise Exception("Circuit breaker is OPEN")
                 
-        try:
-            result = func(*args, **kwargs)
-            if self.state == "HALF_OPEN":
-                self.state = "CLOSED"
-                self.failure_count = 0
-            return result
-        except Exception as e:
-            self.failure_count += 1
-            self.last_failure_time = datetime.now()
+    def _record_success(self):
+        if self.state == "HALF_OPEN":
+            self.state = "CLOSED"
+            self.failure_count = 0
             
-            if self.failure_count >= self.failure_threshold:
-                self.state = "OPEN"
-                
-            raise e
+    def _record_failure(self):
+        self.failure_count += 1
+        self.last_failure_time = datetime.now()
+        
+        if self.failure_count >= self.failure_threshold:
+            self.state = "OPEN"
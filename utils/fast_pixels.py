@@ -0,0 +1,73 @@
+"""
+Per-pixel helpers for SWGOH Automation
+Small ROI scoring kernels, JIT-compiled with numba when it is installed
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+def _roi_match_numpy(frame, template, threshold):
+    """Similarity of template at every position inside a grayscale ROI
+
+    Scores are 1 - mean absolute difference / 255. Positions below
+    threshold are scored 0. Differences are summed one template row at a
+    time, so memory stays at rows x cols x template width.
+    """
+    fh, fw = frame.shape
+    th, tw = template.shape
+    rows, cols = fh - th + 1, fw - tw + 1
+    if rows <= 0 or cols <= 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    total = np.zeros((rows, cols), dtype=np.int32)
+    template = template.astype(np.int16)
+    for r in range(th):
+        windows = np.lib.stride_tricks.sliding_window_view(frame[r:r + rows], tw, axis=1)
+        total += np.abs(windows.astype(np.int16) - template[r]).sum(axis=2, dtype=np.int32)
+    scores = (1.0 - total / (255.0 * th * tw)).astype(np.float32)
+    scores[scores < threshold] = 0.0
+    return scores
+
+# Kernels take plain uint8 ndarrays; all OpenCV I/O (capture, imread,
+# cvtColor) stays with the caller, outside the compiled code
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def roi_match(frame, template, threshold):
+        """Similarity of template at every position inside a grayscale ROI
+
+        Scores are 1 - mean absolute difference / 255. Positions that cannot
+        reach threshold are abandoned early and scored 0.
+        """
+        fh, fw = frame.shape
+        th, tw = template.shape
+        rows, cols = fh - th + 1, fw - tw + 1
+        scores = np.zeros((max(rows, 0), max(cols, 0)), dtype=np.float32)
+        budget = (1.0 - threshold) * 255.0 * th * tw  # Max total difference allowed
+        for y in prange(rows):
+            for x in range(cols):
+                total = 0.0
+                for r in range(th):
+                    for c in range(tw):
+                        total += abs(np.int32(frame[y + r, x + c]) - np.int32(template[r, c]))
+                    if total > budget:
+                        break
+                if total <= budget:
+                    scores[y, x] = 1.0 - total / (255.0 * th * tw)
+        return scores
+else:
+    roi_match = _roi_match_numpy
+
+def best_roi_match(frame, template, threshold=0.9):
+    """Best (score, (x, y)) of template inside a grayscale ROI, or None below threshold"""
+    scores = roi_match(frame, template, threshold)
+    if scores.size == 0:
+        return None
+    y, x = np.unravel_index(np.argmax(scores), scores.shape)
+    score = float(scores[y, x])
+    if score < threshold or score == 0.0:
+        return None
+    return score, (int(x), int(y))
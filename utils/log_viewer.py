@@ -0,0 +1,60 @@
+"""
+Log Viewer for SWGOH Automation
+Prints log files with their epoch timestamps converted to local time,
+optionally keeping only records at or above a level
+
+Usage: python -m utils.log_viewer [--level LEVEL] logs/swgoh_bot.log [more files...]
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+def format_line(line: str) -> str:
+    """Replace a leading '<epoch>.<ms> - ' stamp with local date and time"""
+    stamp, sep, rest = line.partition(' - ')
+    if not sep:
+        return line
+    try:
+        created = float(stamp)
+    except ValueError:
+        return line  # Traceback or other continuation line
+    millis = int(created * 1000) % 1000
+    return f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))},{millis:03d} - {rest}"
+
+def line_level(line: str) -> int:
+    """Level of a record's first line, or None for continuation lines"""
+    parts = line.split(' - ', 3)
+    if len(parts) < 4:
+        return None
+    try:
+        float(parts[0])
+    except ValueError:
+        return None
+    level = logging.getLevelName(parts[2])
+    return level if isinstance(level, int) else None
+
+def main(paths, min_level=logging.NOTSET):
+    """Print each log file in human-readable form"""
+    for path in paths:
+        keep = True
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                level = line_level(line)
+                if level is not None:
+                    keep = level >= min_level
+                # Continuation lines follow the record they belong to
+                if keep:
+                    sys.stdout.write(format_line(line))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="View SWGOH automation logs")
+    parser.add_argument('--level', default='NOTSET',
+                        help="minimum level to show, e.g. ERROR for the error view")
+    parser.add_argument('paths', nargs='+', help="log files to print")
+    args = parser.parse_args()
+    min_level = logging.getLevelName(args.level.upper())
+    if not isinstance(min_level, int):
+        parser.error(f"unknown level: {args.level}")
+    main(args.paths, min_level)
@@ -6,24 +6,133 @@ Provides comprehensive logging with error tracking and performance monitoring
 import logging
 import logging.handlers
 import os
+import queue
+import atexit
 import sys
+import threading
 import time
 import traceback
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
-from dataclasses import dataclass
 import json
+import math
 
-@dataclass
-class LogEntry:
-    """Structured log entry"""
-    timestamp: datetime
-    level: str
-    message: str
-    module: str
-    function: str
-    line: int
-    extra_data: Dict[str, Any] = None
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Source file -> module name, filled on the first log call from each file
+_module_names: Dict[str, str] = {}
+
+def _module_name(filename: str) -> str:
+    """Module name for a code object's co_filename"""
+    name = _module_names.get(filename)
+    if name is None:
+        name = _module_names[filename] = os.path.splitext(os.path.basename(filename))[0]
+    return name
+
+# Caller frame handed from SWGOHLogger._log to the record factory
+_caller = threading.local()
+_base_record_factory = logging.getLogRecordFactory()
+
+def _record_factory(*args, **kwargs):
+    """LogRecord factory that adds the caller info stashed by SWGOHLogger._log
+    
+    Records from other loggers get '-' placeholders so the detailed format
+    works for every record that reaches our handlers.
+    """
+    record = _base_record_factory(*args, **kwargs)
+    frame = getattr(_caller, 'frame', None)
+    if frame is not None:
+        code = frame.f_code
+        record.caller_module = _module_name(code.co_filename)
+        record.caller_function = code.co_name
+        record.caller_line = frame.f_lineno
+    else:
+        record.caller_module = record.caller_function = record.caller_line = '-'
+    return record
+
+class FastRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that tracks the file size in-process
+    
+    The stock handler formats each record an extra time and seeks/tells the
+    stream to decide on rollover; this one counts the characters it writes
+    instead (close enough to bytes for mostly-ASCII log lines).
+    """
+    
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._bytes_written = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        
+    def format(self, record):
+        msg = super().format(record)
+        self._bytes_written += len(msg) + len(self.terminator)
+        return msg
+        
+    def shouldRollover(self, record):
+        return self.maxBytes > 0 and self._bytes_written >= self.maxBytes
+        
+    def doRollover(self):
+        super().doRollover()
+        self._bytes_written = 0
+
+class CachingFormatter(logging.Formatter):
+    """Formatter that formats each record once for every handler sharing it"""
+    
+    def format(self, record):
+        # Keyed on the formatter so one with a different format string never reuses it
+        cached = record.__dict__.get('_formatted_text')
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        text = super().format(record)
+        record._formatted_text = (self, text)
+        return text
+
+class BufferedConsoleHandler(logging.StreamHandler):
+    """Console handler that leaves buffering to sys.stdout
+    
+    Only WARNING and above are flushed immediately; the rest is flushed when
+    the queue listener goes idle or the handler is closed.
+    """
+    
+    def __init__(self):
+        # Skip StreamHandler.__init__: the stream is looked up on every use
+        logging.Handler.__init__(self)
+        
+    @property
+    def stream(self):
+        """Whatever sys.stdout currently is, so its encoding and any replacement apply"""
+        return sys.stdout
+        
+    def emit(self, record):
+        stream = self.stream
+        if stream is None:
+            return  # No console at all (pythonw)
+        try:
+            stream.write(self.format(record) + self.terminator)
+            if record.levelno >= logging.WARNING:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+            
+    def close(self):
+        self.flush()
+        super().close()
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """QueueListener that flushes its handlers whenever the queue runs dry"""
+    
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
 
 class SWGOHLogger:
     """Enhanced logger for SWGOH automation"""
@@ -31,11 +140,17 @@ class SWGOHLogger:
     def __init__(self, name: str = "swgoh_bot", log_dir: str = "logs"):
         self.name = name
         self.log_dir = log_dir
+        self._listener = None
         self.logger = self.setup_logger()
+        # Bound once; these run on every log call
+        self._raw_log = self.logger.log
+        self._enabled_for = self.logger.isEnabledFor
+        atexit.register(self.close)
         self.error_count = 0
         self.warning_count = 0
         self.session_start = datetime.now()
-        self.performance_data = {}
+        self._session_start_perf = time.perf_counter()  # Monotonic twin of session_start
+        self._perf_stats: Dict[str, list] = {}  # key -> [count, mean, m2, min, max] for the session
         
     def setup_logger(self) -> logging.Logger:
         """Setup comprehensive logging configuration"""
@@ -48,10 +163,25 @@ class SWGOHLogger:
         
         # Clear existing handlers
         logger.handlers.clear()
+        self.close()
+        
+        # _log supplies caller info itself; skip the stdlib's per-record
+        # caller lookup and thread/process bookkeeping
+        logging._srcfile = None
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        
+        global _base_record_factory
+        if logging.getLogRecordFactory() is not _record_factory:
+            _base_record_factory = logging.getLogRecordFactory()
+            logging.setLogRecordFactory(_record_factory)
         
         # Formatters
-        detailed_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(module)s:%(funcName)s:%(lineno)d - %(message)s'
+        # File logs stamp the raw epoch time (no strftime per record);
+        # utils/log_viewer.py turns it back into local time for reading
+        detailed_formatter = CachingFormatter(
+            '%(created).3f - %(name)s - %(levelname)s - %(caller_module)s:%(caller_function)s:%(caller_line)s - %(message)s'
         )
         
         simple_formatter = logging.Formatter(
@@ -59,19 +189,19 @@ class SWGOHLogger:
         )
         
         # File handlers
-        # Main log file with rotation
-        main_handler = logging.handlers.RotatingFileHandler(
+        # Main log file with rotation; holds every level, so a performance
+        # (DEBUG) view is `python -m utils.log_viewer --level DEBUG`
+        main_handler = FastRotatingFileHandler(
             os.path.join(self.log_dir, f"{self.name}.log"),
             maxBytes=10*1024*1024,  # 10MB
             backupCount=5,
             encoding='utf-8'
         )
-        main_handler.setLevel(logging.INFO)
+        main_handler.setLevel(logging.DEBUG)
         main_handler.setFormatter(detailed_formatter)
-        logger.addHandler(main_handler)
         
-        # Error log file
-        error_handler = logging.handlers.RotatingFileHandler(
+        # Error log file; reuses the line already formatted for the main log
+        error_handler = FastRotatingFileHandler(
             os.path.join(self.log_dir, f"{self.name}_errors.log"),
             maxBytes=5*1024*1024,  # 5MB
             backupCount=3,
@@ -79,41 +209,48 @@ class SWGOHLogger:
         )
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(detailed_formatter)
-        logger.addHandler(error_handler)
-        
-        # Performance log file
-        perf_handler = logging.handlers.RotatingFileHandler(
-            os.path.join(self.log_dir, f"{self.name}_performance.log"),
-            maxBytes=5*1024*1024,  # 5MB
-            backupCount=2,
-            encoding='utf-8'
-        )
-        perf_handler.setLevel(logging.DEBUG)
-        perf_handler.setFormatter(detailed_formatter)
-        logger.addHandler(perf_handler)
         
         # Console handler
-        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler = BufferedConsoleHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(simple_formatter)
-        logger.addHandler(console_handler)
+        
+        # Callers only enqueue records; formatting, rotation checks and
+        # writes happen on the listener thread
+        log_queue = queue.SimpleQueue()
+        self._listener = FlushingQueueListener(
+            log_queue, main_handler, error_handler, console_handler,
+            respect_handler_level=True
+        )
+        self._listener.start()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
         
         return logger
         
-    def debug(self, message: str, **kwargs):
-        """Log debug message"""
-        self._log(logging.DEBUG, message, **kwargs)
+    def close(self):
+        """Flush queued records and close the log handlers"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        
+    def debug(self, message: str, *args, stacklevel: int = 1, **kwargs):
+        """Log debug message (%-style args are only formatted if emitted)"""
+        self._log(logging.DEBUG, message, args, kwargs, stacklevel)
         
-    def info(self, message: str, **kwargs):
+    def info(self, message: str, *args, stacklevel: int = 1, **kwargs):
         """Log info message"""
-        self._log(logging.INFO, message, **kwargs)
+        self._log(logging.INFO, message, args, kwargs, stacklevel)
         
-    def warning(self, message: str, **kwargs):
+    def warning(self, message: str, *args, stacklevel: int = 1, **kwargs):
         """Log warning message"""
         self.warning_count += 1
-        self._log(logging.WARNING, message, **kwargs)
+        self._log(logging.WARNING, message, args, kwargs, stacklevel)
         
-    def error(self, message: str, exception: Optional[Exception] = None, **kwargs):
+    def error(self, message: str, *args, exception: Optional[Exception] = None,
+              stacklevel: int = 1, **kwargs):
         """Log error message with exception details"""
         self.error_count += 1
         
@@ -121,112 +258,131 @@ class SWGOHLogger:
             kwargs['exception_type'] = type(exception).__name__
             kwargs['exception_message'] = str(exception)
             kwargs['traceback'] = traceback.format_exc()
-            message += f" - Exception: {type(exception).__name__}: {str(exception)}"
+            suffix = f" - Exception: {type(exception).__name__}: {str(exception)}"
+            message += suffix.replace('%', '%%') if args else suffix
             
-        self._log(logging.ERROR, message, **kwargs)
+        self._log(logging.ERROR, message, args, kwargs, stacklevel)
         
-    def critical(self, message: str, **kwargs):
+    def critical(self, message: str, *args, stacklevel: int = 1, **kwargs):
         """Log critical message"""
-        self._log(logging.CRITICAL, message, **kwargs)
-        
-    def _log(self, level: int, message: str, **kwargs):
-        """Internal logging method"""
-        # Get caller information
-        frame = sys._getframe(2)  # Go up 2 frames to get actual caller
-        module = frame.f_globals.get('__name__', 'unknown')
-        function = frame.f_code.co_name
-        line = frame.f_lineno
-        
-        # Create log entry
-        log_entry = LogEntry(
-            timestamp=datetime.now(),
-            level=logging.getLevelName(level),
-            message=message,
-            module=module,
-            function=function,
-            line=line,
-            extra_data=kwargs
-        )
-        
-        # Log with extra data
-        extra = {'extra_data': kwargs} if kwargs else {}
-        self.logger.log(level, message, extra=extra)
-        
-        # Store performance data if provided
-        if 'duration' in kwargs:
-            self.record_performance(module, function, kwargs['duration'])
+        self._log(logging.CRITICAL, message, args, kwargs, stacklevel)
+        
+    def _log(self, level: int, message: str, args: tuple = (),
+             kwargs: Optional[Dict[str, Any]] = None, stacklevel: int = 1):
+        """Internal logging method
+        
+        args and kwargs are the public method's own tuple and dict, passed
+        through as-is. stacklevel counts frames above the public logging
+        method: 1 reports its caller, 2 the caller of a wrapper such as
+        log_action_end.
+        """
+        # Durations are recorded even when the level itself is filtered out
+        duration = kwargs.get('duration') if kwargs else None
+        if duration is None and not self._enabled_for(level):
+            return
             
-    def record_performance(self, module: str, function: str, duration: float):
-        """Record performance metrics"""
-        key = f"{module}.{function}"
-        if key not in self.performance_data:
-            self.performance_data[key] = []
+        # Caller frame for the record factory; skip _log and the public method
+        frame = sys._getframe(stacklevel + 1)
+        _caller.frame = frame
+        try:
+            self._raw_log(level, message, *args,
+                          extra={'extra_data': kwargs} if kwargs else None)
+        finally:
+            _caller.frame = None
             
-        self.performance_data[key].append({
-            'timestamp': datetime.now(),
-            'duration': duration
-        })
-        
-        # Keep only last 100 entries per function
-        if len(self.performance_data[key]) > 100:
-            self.performance_data[key] = self.performance_data[key][-100:]
+        # Store performance data if provided (log_action_end may pass None),
+        # bucketed by what was timed; the caller is only the fallback
+        if duration is not None:
+            if kwargs.get('action') is not None:
+                self.record_performance('action', kwargs['action'], duration)
+            elif kwargs.get('mode') is not None:
+                self.record_performance('battle', f"{kwargs['mode']}/{kwargs.get('stage')}", duration)
+            else:
+                code = frame.f_code
+                self.record_performance(_module_name(code.co_filename), code.co_name, duration)
+            
+    def record_performance(self, category: str, name: str, duration: float):
+        """Record performance metrics under category.name"""
+        key = f"{category}.{name}"
+        stats = self._perf_stats.get(key)
+        if stats is None:
+            self._perf_stats[key] = [1, duration, 0.0, duration, duration]
+            return
+            
+        # Welford's running mean/variance update
+        count = stats[0] = stats[0] + 1
+        delta = duration - stats[1]
+        stats[1] += delta / count
+        stats[2] += delta * (duration - stats[1])
+        if duration < stats[3]:
+            stats[3] = duration
+        if duration > stats[4]:
+            stats[4] = duration
             
-    def log_action_start(self, action: str, **kwargs):
+    def log_action_start(self, action: str, stacklevel: int = 1, **kwargs):
         """Log the start of an action"""
-        self.info(f"Starting action: {action}", action=action, start_time=time.time(), **kwargs)
+        self.info(f"Starting action: {action}", action=action, start_time=time.time(),
+                  stacklevel=stacklevel + 1, **kwargs)
         
-    def log_action_end(self, action: str, success: bool, **kwargs):
+    def log_action_end(self, action: str, success: bool, stacklevel: int = 1, **kwargs):
         """Log the end of an action"""
         duration = kwargs.pop('duration', None)
         if duration is None and 'start_time' in kwargs:
             duration = time.time() - kwargs['start_time']
             
         status = "SUCCESS" if success else "FAILED"
-        self.info(f"Action {action} {status}", action=action, success=success, duration=duration, **kwargs)
+        self.info(f"Action {action} {status}", action=action, success=success, duration=duration,
+                  stacklevel=stacklevel + 1, **kwargs)
         
     def log_screenshot(self, purpose: str, file_path: str = None):
         """Log screenshot capture"""
+        if not self._enabled_for(logging.DEBUG):
+            return
         if file_path:
-            self.debug(f"Screenshot captured: {purpose}", purpose=purpose, file_path=file_path)
+            self._log(logging.DEBUG, "Screenshot captured: %s", (purpose,), {'file_path': file_path})
         else:
-            self.debug(f"Screenshot captured: {purpose}", purpose=purpose)
+            self._log(logging.DEBUG, "Screenshot captured: %s", (purpose,))
             
     def log_ai_decision(self, decision: str, confidence: float, context: Dict = None):
         """Log AI decision making"""
-        self.info(f"AI Decision: {decision}", 
-                decision=decision, 
-                confidence=confidence, 
-                context=context or {})
+        if not self._enabled_for(logging.INFO):
+            return
+        self._log(logging.INFO, "AI Decision: %s", (decision,), {
+            'decision': decision,
+            'confidence': confidence,
+            'context': context or {}
+        })
                 
     def log_energy_state(self, energy_type: str, current: int, maximum: int):
         """Log energy state"""
+        if not self._enabled_for(logging.DEBUG):
+            return
         percentage = (current / maximum * 100) if maximum > 0 else 0
-        self.debug(f"Energy state - {energy_type}: {current}/{maximum} ({percentage:.1f}%)",
-                   energy_type=energy_type, current=current, maximum=maximum, percentage=percentage)
+        self._log(logging.DEBUG, "Energy state - %s: %d/%d (%.1f%%)",
+                  (energy_type, current, maximum, percentage))
                    
     def log_battle_result(self, mode: str, stage: str, victory: bool, stars: int, duration: float):
         """Log battle result"""
         self.info(f"Battle {mode} {stage} - {'Victory' if victory else 'Defeat'} ({stars} stars, {duration:.1f}s)",
-                mode=mode, stage=stage, victory=victory, stars=stars, duration=duration)
+                stacklevel=2, mode=mode, stage=stage, victory=victory, stars=stars, duration=duration)
                 
     def get_session_stats(self) -> Dict[str, Any]:
         """Get current session statistics"""
-        duration = datetime.now() - self.session_start
+        seconds = time.perf_counter() - self._session_start_perf
         
         # Calculate performance stats
         performance_summary = {}
-        for key, entries in self.performance_data.items():
-            if entries:
-                durations = [e['duration'] for e in entries]
-                performance_summary[key] = {
-                    'count': len(entries),
-                    'avg_duration': sum(durations) / len(durations),
-                    'min_duration': min(durations),
-                    'max_duration': max(durations)
-                }
+        for key, (count, mean, m2, min_duration, max_duration) in self._perf_stats.items():
+            performance_summary[key] = {
+                'count': count,
+                'avg_duration': mean,
+                'std_duration': math.sqrt(m2 / count),
+                'min_duration': min_duration,
+                'max_duration': max_duration
+            }
                 
         return {
-            'session_duration': str(duration),
+            'session_duration': f"{int(seconds // 3600)}:{int(seconds % 3600 // 60):02d}:{int(seconds % 60):02d}",
             'error_count': self.error_count,
             'warning_count': self.warning_count,
             'performance_summary': performance_summary
@@ -235,64 +391,71 @@ class SWGOHLogger:
     def save_session_report(self):
         """Save detailed session report"""
         stats = self.get_session_stats()
+        end_time = datetime.now()
         
         report = {
             'session_info': {
                 'start_time': self.session_start.isoformat(),
-                'end_time': datetime.now().isoformat(),
-                'duration_seconds': (datetime.now() - self.session_start).total_seconds()
+                'end_time': end_time.isoformat(),
+                'duration_seconds': time.perf_counter() - self._session_start_perf
             },
             'statistics': stats,
             'errors': self.error_count,
             'warnings': self.warning_count
         }
         
-        report_file = os.path.join(self.log_dir, f"session_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        report_file = os.path.join(self.log_dir, f"session_report_{end_time.strftime('%Y%m%d_%H%M%S')}.json")
         
         try:
-            with open(report_file, 'w') as f:
-                json.dump(report, f, indent=2)
+            if ORJSON_AVAILABLE:
+                with open(report_file, 'wb') as f:
+                    f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+            else:
+                with open(report_file, 'w') as f:
+                    json.dump(report, f, indent=2)
             self.info(f"Session report saved: {report_file}")
         except Exception as e:
             self.error(f"Failed to save session report: {e}")
             
     def cleanup_old_logs(self, days_to_keep: int = 7):
         """Clean up old log files"""
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+        cutoff_ts = time.time() - timedelta(days=days_to_keep).total_seconds()
         
         try:
-            for filename in os.listdir(self.log_dir):
-                file_path = os.path.join(self.log_dir, filename)
-                if os.path.isfile(file_path):
-                    file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    if file_time < cutoff_date:
-                        os.remove(file_path)
-                        self.info(f"Cleaned up old log file: {filename}")
+            # DirEntry caches the file type and stat from the directory scan
+            with os.scandir(self.log_dir) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff_ts:
+                        os.remove(entry.path)
+                        self.info(f"Cleaned up old log file: {entry.name}")
         except Exception as e:
             self.error(f"Failed to cleanup old logs: {e}")
 
 class PerformanceTimer:
     """Context manager for timing operations"""
     
+    __slots__ = ('logger', 'operation', 'start_time')
+    
     def __init__(self, logger: SWGOHLogger, operation: str):
         self.logger = logger
         self.operation = operation
         self.start_time = None
         
     def __enter__(self):
-        self.start_time = time.time()
-        self.logger.log_action_start(self.operation)
+        # Only the end is logged; it carries the duration
+        self.start_time = time.perf_counter()
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
-        duration = time.time() - self.start_time
+        duration = time.perf_counter() - self.start_time
         success = exc_type is None
         
         if exc_type:
             self.logger.error(f"Operation {self.operation} failed: {exc_val}", 
-                            exception=exc_val, duration=duration)
+                            exception=exc_val, action=self.operation, duration=duration,
+                            stacklevel=2)
         else:
-            self.logger.log_action_end(self.operation, True, duration=duration)
+            self.logger.log_action_end(self.operation, True, duration=duration, stacklevel=2)
 
 # Global logger instance
 swgoh_logger = SWGOHLogger()